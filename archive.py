@@ -0,0 +1,181 @@
+import io
+import json
+import time
+import logging
+import argparse
+from pathlib import Path
+
+import polars as pl
+
+# Archive settings: zstd compressed Parquet, the writer dictionary encodes repetitive string columns
+COMPRESSION = 'zstd'
+COMPRESSION_LEVEL = 9
+# Dinlr timestamps look like 2024-03-08T10:52:01+08:00
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S%z'
+TIMESTAMP_SUFFIXES = ('created_at', 'updated_at')
+TIMEZONE = 'Asia/Kuala_Lumpur'
+SOURCE_SUFFIXES = ('.json', '.csv')
+READ_REPEATS = 3
+
+
+def read_source(body, name):
+    """Read a raw JSON or CSV object into a DataFrame."""
+    if name.endswith('.json'):
+        records = json.loads(body.decode('utf-8'))
+        return pl.DataFrame(records, infer_schema_length=None)
+    df = pl.read_csv(io.BytesIO(body), infer_schema_length=None)
+    # Relationalized CSVs write missing values as quoted empty strings, which other CSV readers treat as null
+    return df.with_columns([
+        pl.when(pl.col(name).str.len_bytes() > 0).then(pl.col(name)).alias(name)
+        for name, dtype in df.schema.items() if dtype == pl.Utf8
+    ])
+
+
+def has_timestamps(dtype, name):
+    if dtype == pl.Utf8:
+        return name.endswith(TIMESTAMP_SUFFIXES)
+    if isinstance(dtype, pl.List):
+        return has_timestamps(dtype.inner, name)
+    if isinstance(dtype, pl.Struct):
+        return any(has_timestamps(field.dtype, field.name) for field in dtype.fields)
+    return False
+
+
+def parse_timestamps(expr, dtype, name):
+    """Parse string timestamp fields (created_at, payments.val.created_at, ...) at any nesting depth."""
+    if not has_timestamps(dtype, name):
+        return expr
+    if dtype == pl.Utf8:
+        # Blank or malformed timestamps (e.g. "created_at": "" in JSON) are stored as null
+        return expr.str.to_datetime(TIMESTAMP_FORMAT, strict=False).dt.convert_time_zone(TIMEZONE)
+    if isinstance(dtype, pl.List):
+        return expr.list.eval(parse_timestamps(pl.element(), dtype.inner, name))
+    return pl.struct([
+        parse_timestamps(expr.struct.field(field.name), field.dtype, field.name).alias(field.name)
+        for field in dtype.fields
+    ])
+
+
+def with_typed_timestamps(df):
+    """Store timestamp columns as timezone aware datetimes, so readers get typed columns and min/max statistics."""
+    return df.with_columns([
+        parse_timestamps(pl.col(name), dtype, name).alias(name)
+        for name, dtype in df.schema.items() if has_timestamps(dtype, name)
+    ])
+
+
+def to_parquet(df):
+    """Write a DataFrame to zstd compressed Parquet bytes."""
+    buffer = io.BytesIO()
+    df.write_parquet(buffer, compression=COMPRESSION, compression_level=COMPRESSION_LEVEL, statistics=True)
+    return buffer.getvalue()
+
+
+def best_read_time(read, repeats=READ_REPEATS):
+    """Return the fastest of several timed reads in seconds."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        read()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def convert_object(body, name):
+    """Convert a raw JSON or CSV object to the archive format and report the savings."""
+    df = with_typed_timestamps(read_source(body, name))
+    archived = to_parquet(df)
+
+    source_read = best_read_time(lambda: with_typed_timestamps(read_source(body, name)))
+    archive_read = best_read_time(lambda: pl.read_parquet(io.BytesIO(archived)))
+
+    report = {
+        'name': name,
+        'rows': df.height,
+        'source_bytes': len(body),
+        'archive_bytes': len(archived),
+        'size_reduction': 1 - len(archived) / len(body) if body else 0.0,
+        'source_read_s': source_read,
+        'archive_read_s': archive_read,
+        'read_speedup': source_read / archive_read if archive_read else 0.0,
+    }
+    return archived, report
+
+
+def format_report(report):
+    return (
+        f"{report['name']}: {report['rows']} rows, "
+        f"{report['source_bytes'] / 1024:,.1f} KiB -> {report['archive_bytes'] / 1024:,.1f} KiB "
+        f"({report['size_reduction']:.1%} smaller), "
+        f"read {report['source_read_s'] * 1000:,.1f} ms -> {report['archive_read_s'] * 1000:,.1f} ms "
+        f"({report['read_speedup']:.1f}x faster)"
+    )
+
+
+def convert_local(paths):
+    """Convert local JSON/CSV files (or directories of them) to .parquet files alongside the originals."""
+    reports = []
+    for path in map(Path, paths):
+        files = sorted(p for p in path.iterdir() if p.suffix in SOURCE_SUFFIXES) if path.is_dir() else [path]
+        for file in files:
+            archived, report = convert_object(file.read_bytes(), file.name)
+            file.with_suffix('.parquet').write_bytes(archived)
+            print(format_report(report))
+            reports.append(report)
+    return reports
+
+
+def convert_s3(bucket_name, prefix, dest_prefix='archive/'):
+    """Convert raw JSON/CSV objects under an S3 prefix and write them under dest_prefix."""
+    import boto3
+
+    s3 = boto3.resource('s3')
+    bucket = s3.Bucket(bucket_name)
+    reports = []
+
+    for summary in bucket.objects.filter(Prefix=prefix):
+        key = summary.key
+        if not key.endswith(SOURCE_SUFFIXES) or key.startswith(dest_prefix):
+            continue
+
+        dest_key = f"{dest_prefix}{key.rsplit('.', 1)[0]}.parquet"
+
+        try:
+            body = summary.get()['Body'].read()
+            archived, report = convert_object(body, key)
+            s3.Object(bucket_name, dest_key).put(Body=archived)
+            logging.info(f"Archived {key} to {dest_key}.")
+        except Exception as e:
+            logging.error(f"Failed to archive {key}: {e}")
+            continue
+
+        print(format_report(report))
+        reports.append(report)
+    return reports
+
+
+def print_totals(reports):
+    source_bytes = sum(r['source_bytes'] for r in reports)
+    archive_bytes = sum(r['archive_bytes'] for r in reports)
+    if source_bytes:
+        print(f"Total: {source_bytes / 1024:,.1f} KiB -> {archive_bytes / 1024:,.1f} KiB "
+              f"({1 - archive_bytes / source_bytes:.1%} smaller) across {len(reports)} files")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert raw JSON/CSV data to zstd compressed Parquet with typed timestamps.')
+    subparsers = parser.add_subparsers(dest='source', required=True)
+
+    local_parser = subparsers.add_parser('local', help='Convert local files or directories')
+    local_parser.add_argument('paths', nargs='+')
+
+    s3_parser = subparsers.add_parser('s3', help='Convert objects in an S3 bucket')
+    s3_parser.add_argument('--bucket', default='tug-dinlr')
+    s3_parser.add_argument('--prefix', default='raw/')
+    s3_parser.add_argument('--dest-prefix', default='archive/')
+
+    args = parser.parse_args()
+    if args.source == 'local':
+        print_totals(convert_local(args.paths))
+    else:
+        print_totals(convert_s3(args.bucket, args.prefix, args.dest_prefix))
@@ -1,14 +1,20 @@
 import json
 import boto3
+import asyncio
 import requests
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from rate_limiter import AdaptiveRateLimiter
 
 # Initialize AWS clients and timezone
 ssm_client = boto3.client('ssm')
 s3 = boto3.resource('s3')
 utc_plus_8 = timezone(timedelta(hours=8))
 
+# Maximum number of API calls and S3 reads/writes in flight at once in async mode
+MAX_CONCURRENCY = 8
+
 # Fetch parameters from SSM
 # Function to get secrets from AWS SSM
 def get_secrets(path='/tug-dinlr/api/'):
@@ -41,10 +47,12 @@ params = get_secrets('/tug-dinlr/api/')
 base_url = "https://api.dinlr.com/v1"
 rheaders = {'Content-Type': 'application/x-www-form-urlencoded'}
 aheaders = {"Authorization": f"Bearer {params['ACCESS_TOKEN']}"}
+# Shared by every API call in this invocation
+limiter = AdaptiveRateLimiter()
 
 def get_locations(restaurant_id, headers):
     """Fetch locations from the API and return an iterable of (id, name)."""
-    response = requests.get(f"{base_url}/{restaurant_id}/onlineorder/locations", headers=headers)
+    response = limiter.get(f"{base_url}/{restaurant_id}/onlineorder/locations", headers=headers)
     data = response.json()
     return [(location['id'], location['name']) for location in data['data']]
 
@@ -85,48 +93,48 @@ def refresh_access_token():
 
 def get_items_dim(location_id):
     url = f"{base_url}/{params['RESTAURANT_ID']}/onlineorder/items?location_id={location_id}"
-    response = requests.get(url, headers=aheaders)
+    response = limiter.get(url, headers=aheaders)
     items = response.json()["data"]
     return items
 
 def get_categories_dim():
     url = f"{base_url}/{params['RESTAURANT_ID']}/onlineorder/categories"
-    response = requests.get(url, headers=aheaders)
+    response = limiter.get(url, headers=aheaders)
     categories = response.json()["data"]
     return categories
 
 def get_modifiers_dim(location_id):
     url = f"{base_url}/{params['RESTAURANT_ID']}/onlineorder/modifiers?location_id={location_id}"
-    response = requests.get(url, headers=aheaders)
+    response = limiter.get(url, headers=aheaders)
     modifiers = response.json()["data"]
     return modifiers
 
 def get_discounts_dim(location_id):
     url = f"{base_url}/{params['RESTAURANT_ID']}/onlineorder/discounts?location_id={location_id}"
-    response = requests.get(url, headers=aheaders)
+    response = limiter.get(url, headers=aheaders)
     discounts = response.json()["data"]
     return discounts
 
 def get_promotions_dim(location_id):
     url = f"{base_url}/{params['RESTAURANT_ID']}/onlineorder/promotions?location_id={location_id}"
-    response = requests.get(url, headers=aheaders)
+    response = limiter.get(url, headers=aheaders)
     promotions = response.json()["data"]
     return promotions
 
 def get_customers_dim():
     url = f"{base_url}/{params['RESTAURANT_ID']}/onlineorder/customers"
-    response = requests.get(url, headers=aheaders)
+    response = limiter.get(url, headers=aheaders)
     customers = response.json()["data"]
     return customers
 
 def get_vouchers_dim():
     url = f"{base_url}/{params['RESTAURANT_ID']}/onlineorder/vouchers"
-    response = requests.get(url, headers=aheaders)
+    response = limiter.get(url, headers=aheaders)
     vouchers = response.json()["data"]
     return vouchers
 
 # Function to upload to S3
-def upload_data_to_s3(data, bucket_name, prefix, date_format="%Y-%m-%d"):
+def upload_data_to_s3(data, bucket_name, prefix, date_format="%Y-%m-%d", s3_resource=None):
     if not data:
         logging.info(f"No data to upload for {prefix}.")
         return None
@@ -135,7 +143,7 @@ def upload_data_to_s3(data, bucket_name, prefix, date_format="%Y-%m-%d"):
     
     try:
         # Check if the file already exists in S3
-        obj = s3.Object(bucket_name, file_key)
+        obj = (s3_resource or s3).Object(bucket_name, file_key)
         try:
             existing_data = json.loads(obj.get()['Body'].read().decode('utf-8'))
             logging.info(f"Existing data found for {file_key}.")
@@ -160,9 +168,63 @@ def upload_data_to_s3(data, bucket_name, prefix, date_format="%Y-%m-%d"):
     except Exception as e:
         logging.error(f"Failed to upload {prefix} data: {e}")
 
+# Function to upload to S3 from a worker thread
+def upload_data_to_s3_threaded(data, bucket_name, prefix):
+    # boto3 resources are not thread safe, so each upload gets its own session
+    s3_resource = boto3.session.Session().resource('s3')
+    return upload_data_to_s3(data, bucket_name, prefix, s3_resource=s3_resource)
+
+def extract_dims_sync(bucket_name):
+    """Fetch and upload every dimension one call at a time."""
+    locations = get_locations(params['RESTAURANT_ID'], aheaders)
+    for location_id, location_name in locations:
+        items = get_items_dim(location_id)
+        promotions = get_promotions_dim(location_id)
+        discounts = get_discounts_dim(location_id)
 
+        upload_data_to_s3(items, bucket_name, 'raw/items/items')
+        upload_data_to_s3(promotions, bucket_name, 'raw/promotions/promotions')
+        upload_data_to_s3(discounts, bucket_name, 'raw/discounts/discounts')
+        
+    customers = get_customers_dim()
+    vouchers = get_vouchers_dim()
+    upload_data_to_s3(customers, bucket_name, 'raw/customers/customers')
+    upload_data_to_s3(vouchers, bucket_name, 'raw/vouchers/vouchers')
 
-def lambda_handler(context, event):
+async def extract_dims_async(bucket_name, max_concurrency=MAX_CONCURRENCY):
+    """Fetch and upload every dimension for every location concurrently.
+
+    Blocking API and S3 calls run on a dedicated thread pool, so at most max_concurrency calls are in flight.
+    Each dimension is merged across locations before upload so that no two writers touch the same S3 key.
+    """
+    loop = asyncio.get_running_loop()
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        def run(func, *args):
+            return loop.run_in_executor(executor, func, *args)
+
+        # Restaurant-wide dimensions don't wait on the locations call
+        locations = run(get_locations, params['RESTAURANT_ID'], aheaders)
+
+        async def extract_dim(prefix, func, per_location=True):
+            # Fetch the dimension for every location, then upload as soon as all of them are in
+            if per_location:
+                results = await asyncio.gather(*(run(func, location_id) for location_id, _ in await locations))
+                data = [item for result in results for item in (result or [])]
+            else:
+                data = await run(func)
+            await run(upload_data_to_s3_threaded, data, bucket_name, prefix)
+
+        await asyncio.gather(
+            extract_dim('raw/items/items', get_items_dim),
+            extract_dim('raw/promotions/promotions', get_promotions_dim),
+            extract_dim('raw/discounts/discounts', get_discounts_dim),
+            extract_dim('raw/customers/customers', get_customers_dim, per_location=False),
+            extract_dim('raw/vouchers/vouchers', get_vouchers_dim, per_location=False),
+        )
+
+
+def lambda_handler(event, context):
     if is_token_expired(params['EXPIRES_AT']):
         try:
             new_params = refresh_access_token()
@@ -176,21 +238,15 @@ def lambda_handler(context, event):
 
     bucket_name = 'tug-dinlr'
 
-    # For each location, get dimensions and combine
-    locations = get_locations(params['RESTAURANT_ID'], aheaders)
-    for location_id, location_name in locations:
-        items = get_items_dim(location_id)
-        promotions = get_promotions_dim(location_id)
-        discounts = get_discounts_dim(location_id)
+    # Pass {"mode": "async"} in the event to extract all locations and dimensions concurrently
+    mode = event.get('mode', 'sync') if isinstance(event, dict) else 'sync'
+    if mode == 'async':
+        max_concurrency = int(event.get('max_concurrency', MAX_CONCURRENCY))
+        asyncio.run(extract_dims_async(bucket_name, max_concurrency))
+    else:
+        extract_dims_sync(bucket_name)
 
-        upload_data_to_s3(items, bucket_name, 'raw/items/items')
-        upload_data_to_s3(promotions, bucket_name, 'raw/promotions/promotions')
-        upload_data_to_s3(discounts, bucket_name, 'raw/discounts/discounts')
-        
-    customers = get_customers_dim()
-    vouchers = get_vouchers_dim()
-    upload_data_to_s3(customers, bucket_name, 'raw/customers/customers')
-    upload_data_to_s3(vouchers, bucket_name, 'raw/vouchers/vouchers')
+    logging.info(f"API rate limiter metrics: {limiter.metrics()}")
 
     return {
         'statusCode': 200,
@@ -3,6 +3,7 @@ import boto3
 import requests
 import logging
 from datetime import datetime, timedelta, timezone
+from rate_limiter import AdaptiveRateLimiter
 
 # Initialize AWS clients and timezone
 ssm_client = boto3.client('ssm')
@@ -41,10 +42,19 @@ params = get_secrets('/tug-dinlr/api/')
 base_url = "https://api.dinlr.com/v1"
 rheaders = {'Content-Type': 'application/x-www-form-urlencoded'}
 aheaders = {"Authorization": f"Bearer {params['ACCESS_TOKEN']}"}
+# Shared by every API call in this invocation
+limiter = AdaptiveRateLimiter()
+
+# Nested fields a list payload must carry to be stored without a detail call
+DETAIL_FIELDS = ('items', 'payments', 'refunds')
+# Number of paid orders checked against their detail payloads, on top of every refunded or voided order
+COVERAGE_SAMPLE_SIZE = 3
+# Days of orders fetched per get_all_orders batch when no create_at_max is given
+ORDER_BATCH_DAYS = 31
 
 def get_locations(restaurant_id, headers):
     """Fetch locations from the API and return an iterable of (id, name)."""
-    response = requests.get(f"{base_url}/{restaurant_id}/onlineorder/locations", headers=headers)
+    response = limiter.get(f"{base_url}/{restaurant_id}/onlineorder/locations", headers=headers)
     data = response.json()
     return [(location['id'], location['name']) for location in data['data']]
 
@@ -90,20 +100,16 @@ def get_all_orders(location_id, all=True, update_at_min=None, create_at_min=None
     
     # If no update_at_min is provided, get all orders
     if all:
-        try:
-            while True:
-                url = f"{base_url}/{params['RESTAURANT_ID']}/onlineorder/orders?location_id={location_id}&page={page}"
-                response = requests.get(url, headers=aheaders)
-                data = response.json()["data"]
-                
-                if not data:
-                    break
-                
-                orders.extend(data)
-                page += 1
-                
-        except Exception as e:
-            print(f"An error occurred: {str(e)}")
+        while True:
+            url = f"{base_url}/{params['RESTAURANT_ID']}/onlineorder/orders?location_id={location_id}&page={page}"
+            response = limiter.get(url, headers=aheaders)
+            data = response.json()["data"]
+            
+            if not data:
+                break
+            
+            orders.extend(data)
+            page += 1
 
     # If update_at_min is provided, get orders updated after the specified time
     # Update + sign with %2B for update_at_min
@@ -111,7 +117,7 @@ def get_all_orders(location_id, all=True, update_at_min=None, create_at_min=None
         update_at_min = update_at_min.replace("+", "%2B")
         while True:
             url = f"{base_url}/{params['RESTAURANT_ID']}/onlineorder/orders?location_id={location_id}&update_at_min={update_at_min}&page={page}"
-            response = requests.get(url, headers=aheaders)
+            response = limiter.get(url, headers=aheaders)
             data = response.json()["data"]
             
             if not data:
@@ -125,7 +131,7 @@ def get_all_orders(location_id, all=True, update_at_min=None, create_at_min=None
         # add 32 days to create_at_min
         if not create_at_max:
             create_at_min = convert_to_datetime(create_at_min)
-            create_at_max = create_at_min + timedelta(days=31)
+            create_at_max = create_at_min + timedelta(days=ORDER_BATCH_DAYS)
         else:
             create_at_min = convert_to_datetime(create_at_min)
             create_at_max = convert_to_datetime(create_at_max)
@@ -136,7 +142,7 @@ def get_all_orders(location_id, all=True, update_at_min=None, create_at_min=None
         create_at_min = create_at_min.replace("+", "%2B")
         while True:
             url = f"{base_url}/{params['RESTAURANT_ID']}/onlineorder/orders?location_id={location_id}&create_at_min={create_at_min}&create_at_max={create_at_max}&page={page}"
-            response = requests.get(url, headers=aheaders)
+            response = limiter.get(url, headers=aheaders)
             data = response.json()["data"]
             
             if not data:
@@ -149,11 +155,75 @@ def get_all_orders(location_id, all=True, update_at_min=None, create_at_min=None
 
 def get_order_details(order_id, location='tug'):
     url = f"{base_url}/{params['RESTAURANT_ID']}/onlineorder/orders/{order_id}"
-    response = requests.get(url, headers=aheaders)
+    response = limiter.get(url, headers=aheaders)
     order_details = response.json()["data"]
     order_details['location'] = location
     return order_details
 
+def has_detail_fields(order):
+    """Check whether a list payload carries the nested data of a detail payload."""
+    if any(not isinstance(order.get(field), list) for field in DETAIL_FIELDS) or not order['items']:
+        return False
+    return all('modifier_options' in item and 'discounts' in item for item in order['items'])
+
+def requires_order_details(order):
+    """Check whether an order must always be fetched from the detail endpoint."""
+    if not has_detail_fields(order):
+        return True
+    # Refunded, voided and unsettled orders carry the refund and payment data that must stay correct
+    return bool(order['refunds']) or order.get('financial_status') != 'paid' or order.get('status') != 'closed'
+
+def compare_order_payloads(list_order, detail_order):
+    """Return the fields of a detail payload that are missing or different in the list payload."""
+    return sorted(key for key, value in detail_order.items() if key != 'location' and list_order.get(key) != value)
+
+def check_field_coverage(orders, location='tug', sample_size=COVERAGE_SAMPLE_SIZE):
+    """Fetch details for every order that requires them plus a sample of paid orders, preferring
+    orders with payments, and compare each complete list payload against its detail payload field by field.
+
+    Returns the fetched details keyed by order id, the set of fields that differed and the number
+    of orders compared.
+    """
+    required = [order for order in orders if requires_order_details(order)]
+    trusted = [order for order in orders if not requires_order_details(order)]
+    sample = sorted(trusted, key=lambda order: not order['payments'])[:sample_size]
+
+    details = {}
+    mismatched = set()
+    compared = 0
+    for order in required + sample:
+        details[order['id']] = get_order_details(order['id'], location=location)
+        if has_detail_fields(order):
+            mismatched.update(compare_order_payloads(order, details[order['id']]))
+            compared += 1
+    return details, mismatched, compared
+
+def get_order_payloads(orders, location='tug', detail_mode='always'):
+    """Return stored payloads for orders from the list endpoint.
+
+    In 'auto' mode the list payload of a paid, closed order without refunds is stored as is when it already
+    carries the nested items, payments and refunds. Every other order gets a detail call. If the coverage
+    check finds any difference between list and detail payloads, or compares none, every order falls back
+    to a detail call.
+    """
+    if detail_mode != 'auto':
+        return [get_order_details(order["id"], location=location) for order in orders]
+
+    details, mismatched, compared = check_field_coverage(orders, location)
+    if mismatched:
+        logging.warning(f"List payloads for {location} differ from detail payloads in {sorted(mismatched)}, fetching all details.")
+    # Nothing was compared, so no list payload can be trusted
+    fetch_all = bool(mismatched) or compared == 0
+
+    payloads = []
+    for order in orders:
+        if order['id'] not in details and fetch_all:
+            details[order['id']] = get_order_details(order["id"], location=location)
+        payloads.append(details.get(order['id']) or {**order, 'location': location})
+
+    logging.info(f"Fetched details for {len(details)} of {len(orders)} {location} orders.")
+    return payloads
+
 # Function to upload to S3
 def upload_data_to_s3(data, bucket_name, prefix, date_format="%Y-%m-%d"):
     if not data:
@@ -193,6 +263,94 @@ def upload_data_to_s3(data, bucket_name, prefix, date_format="%Y-%m-%d"):
     return last_created_str
 
 
+# Function to patch updated orders into the stored partitions
+def patch_data_in_s3(data, bucket_name, prefix, date_format="%Y-%m-%d"):
+    """Replace stored orders with their updated versions, matched by id.
+
+    Returns the ids that were not found in any partition and the ids that could not be patched
+    because a partition failed to read or write.
+
+    Partitions are named after the day following the last order in an ingestion batch. The API does not
+    return orders sorted by creation time, but a batch spans at most ORDER_BATCH_DAYS, so an order can only
+    be stored in a partition dated at most that many days before its own creation date.
+    """
+    if not data:
+        logging.info(f"No updated data to patch for {prefix}.")
+        return [], []
+
+    updates = {item['id']: item for item in data}
+    found = set()
+    failed = set()
+    read_failed = False
+    earliest = min(convert_to_datetime(item['created_at']) for item in data).date() - timedelta(days=ORDER_BATCH_DAYS + 1)
+
+    for summary in s3.Bucket(bucket_name).objects.filter(Prefix=f"{prefix}_"):
+        file_key = summary.key
+        try:
+            partition_date = datetime.strptime(file_key[len(prefix) + 1:], f"{date_format}.json").date()
+        except ValueError:
+            continue
+        if partition_date < earliest:
+            continue
+
+        try:
+            obj = s3.Object(bucket_name, file_key)
+            existing_data = json.loads(obj.get()['Body'].read().decode('utf-8'))
+        except Exception as e:
+            # Any of the updated orders may be stored here
+            logging.error(f"Failed to read {file_key}: {e}")
+            read_failed = True
+            continue
+
+        patched = [item['id'] for item in existing_data if item['id'] in updates]
+        if not patched:
+            continue
+
+        combined_data = [updates.get(item['id'], item) for item in existing_data]
+        try:
+            obj.put(Body=(bytes(json.dumps(combined_data, indent=4).encode('UTF-8'))))
+            found.update(patched)
+            logging.info(f"Patched {len(patched)} updated orders into {file_key}.")
+        except Exception as e:
+            logging.error(f"Failed to patch {file_key}: {e}")
+            failed.update(patched)
+
+    not_found = [order_id for order_id in updates if order_id not in found and order_id not in failed]
+    if read_failed:
+        return [], list(failed) + not_found
+    return not_found, list(failed)
+
+def reconcile_orders(location_id, location, bucket_name, prefix, last_updated, last_created=None):
+    """Refetch orders updated since last_updated, patch them into S3 and return the new watermark.
+
+    The watermark never moves past an order that failed to patch, so the next run retries it.
+    """
+    if not last_updated:
+        logging.info(f"No update watermark for {location}, skipping reconciliation.")
+        return None
+
+    orders = get_all_orders(location_id, all=False, update_at_min=last_updated)
+    if not orders:
+        return last_updated
+
+    # Orders created since the create watermark are not stored yet, ingestion will fetch them
+    stored_orders = [
+        order for order in orders
+        if not last_created or convert_to_datetime(order['created_at']) < convert_to_datetime(last_created)
+    ]
+    order_details = [get_order_details(order["id"], location=location) for order in stored_orders]
+    missing, failed = patch_data_in_s3(order_details, bucket_name, prefix)
+    if missing:
+        logging.warning(f"{len(missing)} updated {location} orders older than the create watermark are not stored in S3: {missing}")
+    if failed:
+        logging.error(f"Failed to patch {len(failed)} updated {location} orders, holding the watermark: {failed}")
+        earliest_failed = min(convert_to_datetime(order['updated_at']) for order in stored_orders if order['id'] in failed)
+        return earliest_failed.strftime("%Y-%m-%dT%H:%M:%S+08:00")
+
+    last_updated = max(convert_to_datetime(order['updated_at']) for order in orders) + timedelta(seconds=1)
+    return last_updated.strftime("%Y-%m-%dT%H:%M:%S+08:00")
+
+
 
 def lambda_handler(event, context):
     if is_token_expired(params['EXPIRES_AT']):
@@ -214,14 +372,34 @@ def lambda_handler(event, context):
     
     all_order_details = []
 
+    # Pass {"mode": "reconcile"} in the event to refetch orders updated since the last run instead of ingesting new ones
+    mode = event.get('mode', 'ingest') if isinstance(event, dict) else 'ingest'
+    # Pass {"detail_mode": "auto"} to skip detail calls for orders whose list payload is already complete
+    detail_mode = event.get('detail_mode', 'always') if isinstance(event, dict) else 'always'
+    if mode == 'reconcile':
+        # Fall back to the created watermark on the first reconciliation run
+        last_updated_BANGSAR = params.get('LAST_UPDATED_BANGSAR') or last_created_BANGSAR
+        last_updated_BANGSAR = reconcile_orders(location_id, 'tug_bangsar', bucket_name, 'raw/TUG_Bangsar_orders', last_updated_BANGSAR, last_created_BANGSAR)
+        if last_updated_BANGSAR:
+            ssm_client.put_parameter(Name='/tug-dinlr/api/LAST_UPDATED_BANGSAR', Value=last_updated_BANGSAR, Type='String', Overwrite=True)
+
+        logging.info(f"API rate limiter metrics: {limiter.metrics()}")
+
+        return {
+            'statusCode': 200,
+            'body': json.dumps('S3 reconcile successful')
+        }
+
     orders = get_all_orders(location_id, all=False, create_at_min=last_created_BANGSAR)
-    order_details = [get_order_details(order["id"], location="tug_bangsar") for order in orders]
+    order_details = get_order_payloads(orders, location="tug_bangsar", detail_mode=detail_mode)
     last_created_BANGSAR = upload_data_to_s3(order_details, bucket_name, 'raw/TUG_Bangsar_orders')
 
 
     if last_created_BANGSAR:
         ssm_client.put_parameter(Name='/tug-dinlr/api/LAST_CREATED_BANGSAR', Value=last_created_BANGSAR, Type='String', Overwrite=True)
 
+    logging.info(f"API rate limiter metrics: {limiter.metrics()}")
+
     return {
         'statusCode': 200,
         'body': json.dumps('S3 put successful')
@@ -0,0 +1,174 @@
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+import duckdb
+
+# Timestamps are stored with a +08:00 offset, so dates are bucketed in local time
+TIMEZONE = 'Asia/Kuala_Lumpur'
+TIMESTAMP_SUFFIXES = ('created_at', 'updated_at')
+BENCHMARK_REPEATS = 5
+
+# Representative BI queries: (name, tables required, SQL)
+BENCHMARK_QUERIES = [
+    ('daily_revenue', ['root'], """
+        SELECT CAST(created_at AS DATE) AS day, location, count(*) AS orders, sum(total) AS revenue
+        FROM root
+        GROUP BY ALL
+        ORDER BY day, location
+    """),
+    ('month_revenue', ['root'], """
+        SELECT location, count(*) AS orders, sum(total) AS revenue
+        FROM root
+        WHERE created_at >= TIMESTAMPTZ '2024-03-01 00:00:00+08:00'
+          AND created_at < TIMESTAMPTZ '2024-04-01 00:00:00+08:00'
+        GROUP BY location
+    """),
+    ('payments_by_method', ['root_payments'], """
+        SELECT payments_payment_name AS payment_method, count(*) AS payments,
+               sum(coalesce(payments_amount_double, payments_amount_int)) AS amount
+        FROM root_payments
+        WHERE payments_payment_name IS NOT NULL
+        GROUP BY payment_method
+        ORDER BY amount DESC
+    """),
+    ('monthly_refunds', ['root', 'root_refunds'], """
+        SELECT CAST(date_trunc('month', r.created_at) AS DATE) AS month, count(*) AS refunds,
+               sum(coalesce(f.refunds_amount_double, f.refunds_amount_int)) AS amount
+        FROM root r
+        JOIN root_refunds f ON r.refunds = f.id
+        WHERE f.refunds_id IS NOT NULL
+        GROUP BY month
+        ORDER BY month
+    """),
+    ('top_modifier_options', ['root_items_modifier_options'], """
+        SELECT items_modifier_options_name AS modifier_option, sum(items_modifier_options_qty) AS qty
+        FROM root_items_modifier_options
+        WHERE items_modifier_options_name IS NOT NULL
+        GROUP BY modifier_option
+        ORDER BY qty DESC
+        LIMIT 20
+    """),
+    ('discounts_by_name', ['root_discounts'], """
+        SELECT discounts_name AS discount, count(*) AS uses,
+               sum(coalesce(discounts_amount_double, discounts_amount_int)) AS amount
+        FROM root_discounts
+        WHERE discounts_name IS NOT NULL
+        GROUP BY discount
+        ORDER BY amount DESC
+    """),
+    ('avocado_pistachio_variant', ['root', 'root_items'], """
+        SELECT r.order_no, CAST(r.created_at AS TIMESTAMP) AS created_at, i.items_name, i.items_variant_name, i.items_variant,
+               coalesce(i.items_variant_price_double, i.items_variant_price_int) AS items_variant_price
+        FROM root_items i
+        JOIN root r ON i.id = r.items
+        WHERE i.items_name = 'Avocado Pistachio'
+          AND i.items_variant = 'ba029a57-6a5a-421b-8087-846ff72b332b'
+        ORDER BY r.created_at
+    """),
+]
+
+
+def clean_column_name(name):
+    """Replace the periods in relationalized column names with underscores, as in transform.ipynb."""
+    return name.replace('.val.', '_').replace('.', '_')
+
+
+def column_expression(column, column_type):
+    """Select a column under its clean name, casting timestamps stored as strings to TIMESTAMPTZ."""
+    name = clean_column_name(column)
+    if column_type == 'VARCHAR' and name.endswith(TIMESTAMP_SUFFIXES):
+        return f'CAST(NULLIF("{column}", \'\') AS TIMESTAMPTZ) AS "{name}"'
+    return f'"{column}" AS "{name}"'
+
+
+def connect():
+    con = duckdb.connect()
+    con.sql(f"SET TimeZone = '{TIMEZONE}'")
+    return con
+
+
+def register_tables(con, data_dir):
+    """Register every table under data_dir in DuckDB and return the table names.
+
+    Parquet files and Hive-partitioned Parquet directories (e.g. fact_orders/year=2024/month=3/) are
+    registered as views, so filters on partition columns and Parquet row group statistics prune the
+    files and row groups that are read. CSV files are loaded into memory once, and are skipped when a
+    Parquet copy made by archive.py sits next to them. created_at/updated_at columns stored as strings
+    are cast to TIMESTAMPTZ, so every source exposes the same types.
+    """
+    tables = []
+    for path in sorted(Path(data_dir).iterdir()):
+        location = path.as_posix().replace("'", "''")
+        if path.is_dir():
+            if not any(path.rglob('*.parquet')):
+                continue
+            source, kind = f"read_parquet('{location}/**/*.parquet', hive_partitioning = true, union_by_name = true)", 'VIEW'
+        elif path.suffix == '.parquet':
+            source, kind = f"read_parquet('{location}')", 'VIEW'
+        elif path.suffix == '.csv' and not path.with_suffix('.parquet').exists():
+            source, kind = f"read_csv_auto('{location}', header = true)", 'TABLE'
+        else:
+            continue
+
+        columns = con.sql(f"DESCRIBE SELECT * FROM {source}").fetchall()
+        select = ', '.join(column_expression(column, column_type) for column, column_type, *_ in columns)
+        con.sql(f'CREATE OR REPLACE {kind} "{path.stem}" AS SELECT {select} FROM {source}')
+        tables.append(path.stem)
+    return tables
+
+
+def run_benchmark(con, tables, repeats=BENCHMARK_REPEATS):
+    """Time each representative query whose tables are registered and print the results, reporting failing queries."""
+    results = []
+    for name, required, sql in BENCHMARK_QUERIES:
+        missing = [table for table in required if table not in tables]
+        if missing:
+            print(f"{name}: skipped, missing {', '.join(missing)}")
+            continue
+
+        timings = []
+        try:
+            for _ in range(repeats):
+                start = time.perf_counter()
+                rows = con.sql(sql).fetchall()
+                timings.append(time.perf_counter() - start)
+        except duckdb.Error as e:
+            print(f"{name}: failed, {e}")
+            continue
+
+        result = {
+            'name': name,
+            'rows': len(rows),
+            'min_ms': min(timings) * 1000,
+            'median_ms': statistics.median(timings) * 1000,
+        }
+        print(f"{name}: {result['rows']} rows, min {result['min_ms']:,.1f} ms, median {result['median_ms']:,.1f} ms")
+        results.append(result)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Query the processed fact and dimension tables locally with DuckDB.')
+    parser.add_argument('sql', nargs='?', help='SQL to run against the registered tables')
+    parser.add_argument('--data', default='data/test', help='Directory of Parquet/CSV tables')
+    parser.add_argument('--tables', action='store_true', help='List the registered tables and their columns')
+    parser.add_argument('--benchmark', action='store_true', help='Time the representative BI queries')
+    args = parser.parse_args()
+
+    con = connect()
+    start = time.perf_counter()
+    tables = register_tables(con, args.data)
+    print(f"Registered {len(tables)} tables from {args.data} in {(time.perf_counter() - start) * 1000:,.1f} ms")
+
+    if args.tables:
+        for table in tables:
+            columns = [row[0] for row in con.sql(f'DESCRIBE "{table}"').fetchall()]
+            print(f"{table}: {', '.join(columns)}")
+    if args.benchmark:
+        run_benchmark(con, tables)
+    if args.sql:
+        start = time.perf_counter()
+        con.sql(args.sql).show()
+        print(f"Query took {(time.perf_counter() - start) * 1000:,.1f} ms")
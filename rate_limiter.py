@@ -0,0 +1,155 @@
+import time
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+import requests
+
+# Dinlr API throughput settings, in requests per second
+INITIAL_RATE = 10.0
+MIN_RATE = 0.5
+MAX_RATE = 50.0
+# Additive increase (requests per second) per successful request and multiplicative decrease per throttling window
+RATE_INCREASE = 0.1
+RATE_DECREASE = 0.5
+MAX_RETRIES = 5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def parse_retry_after(value):
+    """Return the number of seconds to wait from a Retry-After header (seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class AdaptiveRateLimiter:
+    """Token bucket shared by every thread (and asyncio executor task) in an invocation.
+
+    The refill rate halves at most once per throttling window, however many in-flight requests get a
+    429 together. It grows by RATE_INCREASE per successful request, but only while callers are using up
+    the bucket, so the rate tracks real demand and settles just under the API quota.
+    A Retry-After header pauses all callers.
+    """
+
+    def __init__(self, rate=INITIAL_RATE, min_rate=MIN_RATE, max_rate=MAX_RATE, max_retries=MAX_RETRIES):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.max_retries = max_retries
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.cooldown_until = 0.0
+        self.lock = threading.Lock()
+
+        self.requests = 0
+        self.throttled_responses = 0
+        # Wall-clock time every caller was paused by a 429 or Retry-After
+        self.throttled_seconds = 0.0
+        # Time callers spent waiting for a token, summed across threads
+        self.pacing_wait_seconds = 0.0
+        # Time callers slept before retrying a 5xx, summed across threads
+        self.backoff_seconds = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        paced = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.requests += 1
+                    self.pacing_wait_seconds += paced
+                    return
+                if now < self.paused_until:
+                    # Paused by a 429, already counted in throttled_seconds
+                    wait, pacing = self.paused_until - now, False
+                else:
+                    wait, pacing = (1 - self.tokens) / self.rate, True
+            time.sleep(wait)
+            if pacing:
+                paced += wait
+
+    def on_success(self):
+        with self.lock:
+            # A bucket with tokens to spare means callers aren't limited by the rate, so don't raise it
+            self._refill(time.monotonic())
+            if self.tokens >= 1:
+                return
+            self.rate = min(self.max_rate, self.rate + RATE_INCREASE)
+            self.capacity = max(1.0, self.rate)
+
+    def on_throttle(self, retry_after=None):
+        """Pause every caller after a 429, and slow down once per throttling window."""
+        with self.lock:
+            now = time.monotonic()
+            self.throttled_responses += 1
+            if now >= self.cooldown_until:
+                self.rate = max(self.min_rate, self.rate * RATE_DECREASE)
+                self.capacity = max(1.0, self.rate)
+                self.tokens = min(self.tokens, 0.0)
+            delay = retry_after if retry_after is not None else 1 / self.rate
+
+            # Responses to requests already in flight land inside this window and don't slow down again
+            self.cooldown_until = max(self.cooldown_until, now + max(delay, 1 / self.rate))
+            paused_until = max(self.paused_until, now + delay)
+            self.throttled_seconds += paused_until - max(self.paused_until, now)
+            self.paused_until = paused_until
+            return delay
+
+    def get(self, url, **kwargs):
+        """GET a URL under the limiter, retrying 429 and 5xx responses.
+
+        Raises requests.HTTPError if the response is still unsuccessful after max_retries.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire()
+            response = requests.get(url, **kwargs)
+
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                break
+
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if response.status_code == 429:
+                delay = self.on_throttle(retry_after)
+                logging.warning(f"Rate limited by {url}, retrying after {delay:.1f}s.")
+            else:
+                delay = retry_after if retry_after is not None else 2 ** attempt
+                logging.warning(f"Got {response.status_code} from {url}, retrying after {delay:.1f}s.")
+                time.sleep(delay)
+                with self.lock:
+                    self.backoff_seconds += delay
+
+        response.raise_for_status()
+        self.on_success()
+        return response
+
+    def metrics(self):
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'throttled_responses': self.throttled_responses,
+                'throttled_seconds': round(self.throttled_seconds, 3),
+                'pacing_wait_seconds': round(self.pacing_wait_seconds, 3),
+                'backoff_seconds': round(self.backoff_seconds, 3),
+                'rate': round(self.rate, 3),
+            }